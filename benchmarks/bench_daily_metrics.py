@@ -0,0 +1,124 @@
+"""
+Compares memory and time of the original dict based daily metrics pipeline against the array backed
+DailyMetricsStore on a synthetic year-long backfill. Both variants run end to end through GoogleMyBusiness -
+parsing the responses, writing the temp files and finalising the output csv.
+
+The baseline reproduces the parsing of list_daily_metrics and daily_metrics_parser from before the store was
+introduced, which write one json temp file per row through create_temp_files.
+
+Usage: python benchmarks/bench_daily_metrics.py [locations] [days]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+from google_my_business import GoogleMyBusiness, AVAILABLE_DAILY_METRICS  # noqa: E402
+
+START_DATE = date(2023, 1, 1)
+
+
+def synthetic_responses(days):
+    """Parsed API time series responses of a single location - dated values for every metric."""
+    random.seed(0)
+    responses = {}
+    for metric in AVAILABLE_DAILY_METRICS:
+        dated_values = []
+        for i in range(days):
+            day = START_DATE + timedelta(days=i)
+            dated_value = {"date": {"year": day.year, "month": day.month, "day": day.day}}
+            if random.random() > 0.2:
+                dated_value["value"] = str(random.randint(1, 500))
+            dated_values.append(dated_value)
+        responses[metric] = dated_values
+    return responses
+
+
+def timestamp(day):
+    return day.strftime('%Y-%m-%dT00:00:00.000000Z')
+
+
+def create_gmb(data_folder, days):
+    os.makedirs(os.path.join(data_folder, "temp"))
+    os.makedirs(os.path.join(data_folder, "out", "tables"))
+    return GoogleMyBusiness(access_token="token", data_folder_path=data_folder,
+                            start_timestamp=timestamp(START_DATE),
+                            end_timestamp=timestamp(START_DATE + timedelta(days=days - 1)),
+                            finalise_workers=1)
+
+
+def baseline_pipeline(gmb, locations, responses):
+    """The original pipeline - nested {date: {metric: value}} dicts expanded into one json temp file per row."""
+    daily_metrics = {}
+    for location in range(locations):
+        parsed_values = {}
+        for metric in AVAILABLE_DAILY_METRICS:
+            for dated_value in responses[metric]:
+                day = f"{dated_value['date']['year']}-{dated_value['date']['month']:02d}-" \
+                      f"{dated_value['date']['day']:02d}"
+                value = int(dated_value.get('value', '0'))
+                if day not in parsed_values:
+                    parsed_values[day] = {}
+                parsed_values[day][metric] = value
+        daily_metrics[str(location)] = parsed_values
+
+    data_out = []
+    for location_id, date_data in daily_metrics.items():
+        for day, metrics in date_data.items():
+            for metric, value in metrics.items():
+                data_out.append({"location_id": location_id, "date": day, "metric": metric, "value": value})
+    gmb.create_temp_files('daily_metrics', data_out)
+    gmb.save_resulting_files()
+
+
+def store_pipeline(gmb, locations, responses):
+    store = gmb.create_daily_metrics_store()
+    for location in range(locations):
+        series = store.new_series()
+        for metric in AVAILABLE_DAILY_METRICS:
+            store.set_time_series(series, metric, responses[metric])
+        store.add(str(location), series)
+    gmb.daily_metrics_parser(store)
+    gmb.save_resulting_files()
+
+
+def run(pipeline, locations, days, responses, trace_memory):
+    data_folder = tempfile.mkdtemp()
+    try:
+        gmb = create_gmb(data_folder, days)
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        pipeline(gmb, locations, responses)
+        elapsed = time.perf_counter() - start
+        peak = 0
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        with open(os.path.join(data_folder, "out", "tables", "daily_metrics.csv")) as f:
+            rows = sum(1 for _ in f) - 1
+        return rows, elapsed, peak
+    finally:
+        shutil.rmtree(data_folder)
+
+
+def main():
+    locations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    print(f"{locations} locations x {len(AVAILABLE_DAILY_METRICS)} metrics x {days} days")
+    responses = synthetic_responses(days)
+    for label, pipeline in (("dict pipeline", baseline_pipeline), ("array store", store_pipeline)):
+        rows, elapsed, _ = run(pipeline, locations, days, responses, trace_memory=False)
+        _, _, peak = run(pipeline, locations, days, responses, trace_memory=True)
+        print(f"{label:>14}: {rows} rows, {elapsed:7.2f} s, peak memory {peak / 1024 ** 2:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares table finalisation time and bytes written of the single file csv output against the sliced gzip output.
+
+Usage: python benchmarks/bench_finalisation.py [rows_per_table]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+from google_my_business import GoogleMyBusiness, finalise_table  # noqa: E402
+
+TABLES = ["reviews", "daily_metrics", "media", "questions"]
+
+
+def synthetic_rows(table, count):
+    for i in range(count):
+        yield {
+            "reviewId": f"{table}-{i}",
+            "name": f"accounts/1/locations/{i % 2000}",
+            "comment": "Great place, friendly staff. " * random.randint(1, 10),
+            "starRating": random.choice(["ONE", "TWO", "THREE", "FOUR", "FIVE"]),
+            "createTime": "2023-01-01T10:00:00Z",
+            "reviewer_displayName": f"Reviewer {i}",
+        }
+
+
+def folder_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def finalise_sequentially(gmb):
+    """
+    Finalisation as it was before the process pool - one table after another, each into a single csv. Uses the
+    same single file logic of finalise_table as the parallel variant.
+    """
+    for table in TABLES:
+        finalise_table(os.path.join(gmb.temp_table_destination, table),
+                       os.path.join(gmb.default_table_destination, f"{table}.csv"), [])
+
+
+def run(rows, sliced, sequential=False):
+    # same synthetic data for every variant, so the written bytes are comparable
+    random.seed(0)
+    data_folder = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(data_folder, "out", "tables"))
+        gmb = GoogleMyBusiness(access_token="token", data_folder_path=data_folder, sliced_output=sliced)
+        for table in TABLES:
+            gmb.create_temp_files(table, synthetic_rows(table, rows))
+
+        start = time.perf_counter()
+        if sequential:
+            finalise_sequentially(gmb)
+        else:
+            gmb.save_resulting_files()
+        elapsed = time.perf_counter() - start
+
+        written = sum(folder_size(os.path.join(data_folder, "out", "tables", f"{t}.csv")) for t in TABLES)
+        return elapsed, written
+    finally:
+        shutil.rmtree(data_folder)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{len(TABLES)} tables x {rows} rows")
+    variants = (
+        ("single csv, sequential", False, True),
+        ("single csv, parallel", False, False),
+        ("sliced csv.gz, parallel", True, False),
+    )
+    for label, sliced, sequential in variants:
+        elapsed, written = run(rows, sliced, sequential)
+        print(f"{label:>24}: {elapsed:7.2f} s, {written / 1024 ** 2:8.2f} MB written")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,15 @@ import json
 import dateparser
 import requests
 import shutil
+import tarfile
 
 from keboola.component.base import ComponentBase, sync_action
 from keboola.component.exceptions import UserException
 
-from google_my_business import GoogleMyBusiness, GoogleMyBusinessException
+from google_my_business import GoogleMyBusiness, GoogleMyBusinessException, DEFAULT_SLICE_SIZE_MB
+from profiling import ExtractionProfiler
+from response_cache import ResponseCache, ResponseCacheMiss, MODES, MODE_PASS_THROUGH, MODE_RECORD, MODE_REPLAY, \
+    DEFAULT_MAX_SIZE_MB, ENTRY_SUFFIX
 
 # configuration variables
 KEY_API_TOKEN = '#api_token'
@@ -17,9 +21,18 @@ KEY_ENDPOINTS = 'endpoints'
 KEY_ACCOUNTS = 'accounts'
 KEY_GROUP_DESTINATION = 'destination'
 KEY_LOAD_TYPE = 'load_type'
+KEY_SLICED_OUTPUT = 'sliced_output'
+KEY_SLICE_SIZE_MB = 'slice_size_mb'
+KEY_DEBUG_PROFILE = 'debug_profile'
+KEY_GROUP_RESPONSE_CACHE = 'response_cache'
+KEY_CACHE_MODE = 'mode'
+KEY_CACHE_MAX_SIZE_MB = 'max_size_mb'
 
 MANDATORY_PARS = [KEY_ENDPOINTS, KEY_API_TOKEN]
 
+RESPONSE_CACHE_TAG = 'google_my_business_response_cache'
+RESPONSE_CACHE_ARCHIVE = 'response_cache.tar'
+
 
 class Component(ComponentBase):
 
@@ -30,6 +43,13 @@ class Component(ComponentBase):
         """
         Main execution code
         """
+        if self.configuration.parameters.get(KEY_DEBUG_PROFILE, False):
+            with ExtractionProfiler(self.files_out_path):
+                self.run_extraction(finalise_workers=1)
+        else:
+            self.run_extraction()
+
+    def run_extraction(self, finalise_workers=None):
         params = self.configuration.parameters
         authorization = self.configuration.config_data["authorization"]
         oauth_token = self.get_oauth_token(authorization)
@@ -56,6 +76,12 @@ class Component(ComponentBase):
 
         destination_params = params.get(KEY_GROUP_DESTINATION, {})
         incremental = destination_params.get(KEY_LOAD_TYPE) != 'full_load' if destination_params else False
+        sliced_output = destination_params.get(KEY_SLICED_OUTPUT, False)
+        slice_size_mb = destination_params.get(KEY_SLICE_SIZE_MB, DEFAULT_SLICE_SIZE_MB)
+        if slice_size_mb <= 0:
+            raise UserException('Slice size must be a positive number of MB.')
+
+        response_cache = self.get_response_cache(params.get(KEY_GROUP_RESPONSE_CACHE) or {})
 
         statefile = self.get_state_file()
         default_columns = statefile or []
@@ -71,12 +97,21 @@ class Component(ComponentBase):
             data_folder_path=self.data_folder_path,
             default_columns=default_columns,
             accounts=accounts,
-            incremental=incremental
+            incremental=incremental,
+            sliced_output=sliced_output,
+            slice_size_mb=slice_size_mb,
+            finalise_workers=finalise_workers,
+            response_cache=response_cache
         )
         try:
             gmb.process(endpoints=endpoints)
-        except GoogleMyBusinessException as e:
+        except (GoogleMyBusinessException, ResponseCacheMiss) as e:
             raise UserException(e)
+        finally:
+            if response_cache is not None:
+                logging.info(f"Response cache hits: {response_cache.hits}, misses: {response_cache.misses}")
+                if response_cache.mode == MODE_RECORD:
+                    self.save_response_cache(response_cache)
 
         self.write_state_file(gmb.tables_columns)
         self.delete_temp_folder()
@@ -113,6 +148,57 @@ class Component(ComponentBase):
         data_r = response.json()
         return data_r["access_token"]
 
+    def get_response_cache(self, cache_params):
+        mode = cache_params.get(KEY_CACHE_MODE, MODE_PASS_THROUGH)
+        if mode not in MODES:
+            raise UserException(f"Unsupported response cache mode {mode}, supported modes are {MODES}.")
+        if mode == MODE_PASS_THROUGH:
+            return None
+
+        max_size_mb = cache_params.get(KEY_CACHE_MAX_SIZE_MB, DEFAULT_MAX_SIZE_MB)
+        if max_size_mb <= 0:
+            raise UserException('Response cache size must be a positive number of MB.')
+
+        cache_path = os.path.join(self.data_folder_path, "response_cache")
+        restored = self.restore_response_cache(cache_path)
+        if mode == MODE_REPLAY and not restored:
+            raise UserException(f"Replay Only mode needs the response cache recorded by a previous run. Add a file "
+                                f"input mapping of the latest file tagged {RESPONSE_CACHE_TAG} to the configuration.")
+
+        logging.info(f"Using response cache in {mode} mode stored in {cache_path}")
+        return ResponseCache(cache_path, mode=mode, max_size_mb=max_size_mb)
+
+    def restore_response_cache(self, cache_path):
+        """
+        Extracts the response cache archive of a previous run from input files into cache_path.
+        Returns False if there is no such archive.
+        """
+        archives = self.get_input_files_definitions(tags=[RESPONSE_CACHE_TAG], only_latest_files=True)
+        if not archives:
+            logging.info(f"No input file tagged {RESPONSE_CACHE_TAG} found, starting with an empty response cache.")
+            return False
+
+        os.makedirs(cache_path, exist_ok=True)
+        with tarfile.open(archives[0].full_path, 'r') as tar:
+            # only flat cache entries are extracted, anything else in the archive is ignored
+            members = [m for m in tar.getmembers()
+                       if m.isfile() and m.name.endswith(ENTRY_SUFFIX) and os.path.basename(m.name) == m.name]
+            tar.extractall(cache_path, members=members)
+        logging.info(f"Restored {len(members)} cached responses from {archives[0].name}")
+        return True
+
+    def save_response_cache(self, response_cache):
+        """
+        Stores the response cache as a tagged output file, so the next run can read it through file input mapping.
+        """
+        file_def = self.create_out_file_definition(RESPONSE_CACHE_ARCHIVE, tags=[RESPONSE_CACHE_TAG])
+        with tarfile.open(file_def.full_path, 'w') as tar:
+            for entry in os.scandir(response_cache.folder_path):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    tar.add(entry.path, arcname=entry.name)
+        self.write_manifest(file_def)
+        logging.info(f"Response cache stored to output file {RESPONSE_CACHE_ARCHIVE} tagged {RESPONSE_CACHE_TAG}")
+
     def create_temp_folder(self):
         temp_path = os.path.join(self.data_folder_path, "temp")
         if not os.path.exists(temp_path):
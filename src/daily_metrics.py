@@ -0,0 +1,74 @@
+import csv
+from array import array
+from datetime import date, timedelta
+
+MISSING_VALUE = -1
+COLUMNS = ["location_id", "date", "metric", "value"]
+
+
+class DailyMetricsStore:
+    """
+    Compact storage of daily metrics time series. Every location holds a single flat integer array indexed by
+    day offset from the start date and metric index, days without a value hold MISSING_VALUE.
+    """
+
+    def __init__(self, start_date, end_date, metrics):
+        self.start_ordinal = start_date.toordinal()
+        self.days = (end_date - start_date).days + 1
+        self.metrics = list(metrics)
+        self.metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+        self.series = {}
+
+    def new_series(self):
+        return array('q', [MISSING_VALUE]) * (self.days * len(self.metrics))
+
+    def day_offset(self, year, month, day):
+        return date(year, month, day).toordinal() - self.start_ordinal
+
+    def set_time_series(self, series, metric, dated_values):
+        """
+        Stores dated values of a single metric as returned by getDailyMetricsTimeSeries. Dates outside of the
+        store range are skipped, returns the list of skipped dates.
+        """
+        metrics_count = len(self.metrics)
+        metric_index = self.metric_index[metric]
+        skipped = []
+        for dated_value in dated_values:
+            day_offset = self.day_offset(**dated_value['date'])
+            if not 0 <= day_offset < self.days:
+                skipped.append(date.fromordinal(self.start_ordinal + day_offset).isoformat())
+                continue
+            series[day_offset * metrics_count + metric_index] = int(dated_value.get('value', '0'))
+        return skipped
+
+    def add(self, location_id, series):
+        self.series[location_id] = series
+
+    def date_strings(self):
+        start = date.fromordinal(self.start_ordinal)
+        return [(start + timedelta(days=i)).isoformat() for i in range(self.days)]
+
+    def iter_rows(self):
+        """Yields (location_id, date, metric, value) for every stored value."""
+        dates = self.date_strings()
+        metrics = self.metrics
+        metrics_count = len(metrics)
+        for location_id, series in self.series.items():
+            for i, value in enumerate(series):
+                if value != MISSING_VALUE:
+                    day_offset, metric_index = divmod(i, metrics_count)
+                    yield location_id, dates[day_offset], metrics[metric_index], value
+
+    def write_csv(self, path):
+        """Writes all the stored values into a csv with header, returns the number of written rows."""
+        rows_written = 0
+        with open(path, 'w', newline='') as out:
+            writer = csv.writer(out, lineterminator='\n')
+            writer.writerow(COLUMNS)
+            for row in self.iter_rows():
+                writer.writerow(row)
+                rows_written += 1
+        return rows_written
+
+    def __len__(self):
+        return len(self.series)
@@ -1,17 +1,26 @@
 import os
+import io
+import csv
+import gzip
 import json
+import shutil
 import requests
 import logging
-from datetime import datetime
+from datetime import datetime, date
 import uuid
 import backoff
+from concurrent.futures import ProcessPoolExecutor
 from ratelimit import limits, sleep_and_retry
 
 from keboola.csvwriter import ElasticDictWriter
 
 from definitions import mapping
+from response_cache import ResponseCacheMiss
+from daily_metrics import DailyMetricsStore, COLUMNS as DAILY_METRICS_COLUMNS
 
 PAGE_SIZE = 50
+DEFAULT_SLICE_SIZE_MB = 50
+GZIP_COMPRESS_LEVEL = 6
 
 AVAILABLE_DAILY_METRICS = ["BUSINESS_IMPRESSIONS_DESKTOP_MAPS", "BUSINESS_IMPRESSIONS_DESKTOP_SEARCH",
                            "BUSINESS_IMPRESSIONS_MOBILE_MAPS", "BUSINESS_IMPRESSIONS_MOBILE_SEARCH",
@@ -88,9 +97,14 @@ def backoff_custom():
 
 class GoogleMyBusiness:
     def __init__(self, access_token, data_folder_path, default_columns=None, start_timestamp=None, end_timestamp=None,
-                 accounts=None, incremental=True):
+                 accounts=None, incremental=True, sliced_output=False, slice_size_mb=DEFAULT_SLICE_SIZE_MB,
+                 finalise_workers=None, response_cache=None):
         if default_columns is None:
             default_columns = []
+        self.sliced_output = sliced_output
+        self.slice_size_bytes = int(slice_size_mb * 1024 ** 2)
+        self.finalise_workers = finalise_workers
+        self.response_cache = response_cache
         self.output_columns = None
         self.access_token = access_token
         self.incremental = incremental
@@ -110,7 +124,8 @@ class GoogleMyBusiness:
         self.reviews = []
         self.questions = []
         self.media = []
-        self.daily_metrics = {}
+        self.daily_metrics = None
+        self.temp_columns = {}
 
         self.tables_columns = default_columns if default_columns else {}
         self.selected_accounts = accounts if accounts else []
@@ -169,14 +184,17 @@ class GoogleMyBusiness:
                 continue
 
             if 'dailyMetrics' in endpoints:
+                self.daily_metrics = self.create_daily_metrics_store()
                 for location in all_locations:
                     location_path = location['name']
                     location_title = location['title']
                     location_id = location_path.replace("locations/", "")
                     logging.info(f"Processing endpoint dailyMetrics for {location_title}.")
-                    self.daily_metrics[location_id] = self.list_daily_metrics(location_id=location_path)
+                    series = self.list_daily_metrics(location_id=location_path, store=self.daily_metrics)
+                    if series is not None:
+                        self.daily_metrics.add(location_id, series)
                 self.daily_metrics_parser(data_in=self.daily_metrics)
-            self.daily_metrics = {}
+            self.daily_metrics = None
 
             if 'reviews' in endpoints:
                 for location in all_locations:
@@ -213,10 +231,36 @@ class GoogleMyBusiness:
 
         self.save_resulting_files()
 
+    def create_daily_metrics_store(self):
+        start_date = date(*get_date_from_string(self.start_timestamp))
+        end_date = date(*get_date_from_string(self.end_timestamp))
+        return DailyMetricsStore(start_date, end_date, AVAILABLE_DAILY_METRICS)
+
+    def get_request(self, url, headers=None, params=None, cache_errors=True):
+        """
+        Sends the GET request, or serves it from the response cache if one is set. Cache hits are not rate limited.
+        Requests retried on errors must pass cache_errors=False, so a cached error is not served to every retry.
+        """
+        if self.response_cache is None:
+            return self.send_request(url, headers=headers, params=params)
+
+        cached = self.response_cache.get(url, params)
+        if cached is not None and (cache_errors or not cached.error):
+            return cached.status_code, cached
+        if self.response_cache.replay_only:
+            raise ResponseCacheMiss(f"Response for {url} (cache key {self.response_cache.key(url, params)}) is not "
+                                    f"in the response cache. The cache was recorded for a different extraction "
+                                    f"or the entry was evicted.")
+
+        res_status, res = self.send_request(url, headers=headers, params=params)
+        if cache_errors or res_status == 200:
+            self.response_cache.put(url, params, res_status, res.text)
+        return res_status, res
+
     @sleep_and_retry
     @limits(calls=290, period=61)
     @backoff.on_exception(backoff_custom, Exception, max_tries=7)
-    def get_request(self, url, headers=None, params=None):
+    def send_request(self, url, headers=None, params=None):
         res = self.session.get(url=url, headers=headers, params=params)
         if res.status_code == 429:
             # Raise an exception to trigger the retry logic
@@ -275,7 +319,7 @@ class GoogleMyBusiness:
             params['pageToken'] = nextPageToken
 
         res_status, location_raw = self.get_request(
-            location_url, params=params)
+            location_url, params=params, cache_errors=False)
         if res_status != 200:
             raise GoogleMyBusinessException(f'Something wrong with location request. Response: {location_raw.text}')
         location_json = location_raw.json()
@@ -297,16 +341,16 @@ class GoogleMyBusiness:
 
         return out_location_list
 
-    def list_daily_metrics(self, location_id):
+    def list_daily_metrics(self, location_id, store):
         """
-        Fetching all the report insights from assigned location.
+        Fetching all the report insights from assigned location into a new series of the store.
         https://developers.google.com/my-business/reference/performance/rest/v1/
         locations/getDailyMetricsTimeSeries#DailyRange
         """
         start_year, start_month, start_day = get_date_from_string(self.start_timestamp)
         end_year, end_month, end_day = get_date_from_string(self.end_timestamp)
 
-        parsed_values = {}
+        series = store.new_series()
         for metric in AVAILABLE_DAILY_METRICS:
             insight_url = self.base_url_profile_performance + f"/{location_id}:getDailyMetricsTimeSeries"
             params = {
@@ -330,26 +374,21 @@ class GoogleMyBusiness:
                 if res_status == 403:
                     logging.error(f"Cannot fetch daily metrics for location with id {location_id}, response: "
                                   f"{insights_raw.text}")
-                    return {}
+                    return None
                 raise GoogleMyBusinessException(f'Something wrong with report insight request. '
                                                 f'Response: {insights_raw.text}')
 
             response = insights_raw.json()
             if 'timeSeries' in response:
-                time_series = response['timeSeries']['datedValues']
-
-                for dated_value in time_series:
-                    date = f"{dated_value['date']['year']}-{dated_value['date']['month']:02d}-" \
-                           f"{dated_value['date']['day']:02d}"
-                    value = int(dated_value.get('value', '0'))
-                    if date not in parsed_values:
-                        parsed_values[date] = {}
-                    parsed_values[date][metric] = value
+                skipped = store.set_time_series(series, metric, response['timeSeries']['datedValues'])
+                if skipped:
+                    logging.warning(f"Metric {metric} for location with id {location_id} returned values for dates "
+                                    f"outside of the request range, skipping them: {skipped}")
 
             else:
                 logging.info(f"Metric {metric} did not return any time series.")
 
-        return parsed_values
+        return series
 
     def list_reviews(self, account_id, location_id, nextPageToken=None):
         responses = []
@@ -427,7 +466,7 @@ class GoogleMyBusiness:
         if nextPageToken:
             params['pageToken'] = nextPageToken
 
-        res_status, data_raw = self.get_request(url, params=params)
+        res_status, data_raw = self.get_request(url, params=params, cache_errors=False)
         if res_status != 200:
             raise GoogleMyBusinessException(f'Something wrong with request. Response: {data_raw.text}')
         if res_status == 503:
@@ -455,16 +494,19 @@ class GoogleMyBusiness:
             os.makedirs(file_output_destination)
 
         if data_in:
+            temp_columns = self.temp_columns.setdefault(file_name, {})
             for row in data_in:
                 filename = os.path.join(file_output_destination, str(uuid.uuid4())+".json")
+                flat_row = flatten_dict(row)
+                temp_columns.update(dict.fromkeys(flat_row))
                 with open(filename, 'w') as outfile:
-                    json.dump(flatten_dict(row), outfile)
+                    json.dump(flat_row, outfile)
         else:
             logging.warning(f"File {file_name} is empty. Results will not be stored.")
 
-    def produce_manifest(self, file_name, primary_key):
+    def produce_manifest(self, file_name, primary_key, columns=None):
         """
-        Dummy function for returning manifest
+        Dummy function for returning manifest, sliced tables have headerless slices and need the columns listed
         """
 
         file = '{}{}.csv.manifest'.format(self.default_table_destination, file_name)
@@ -473,6 +515,8 @@ class GoogleMyBusiness:
             'incremental': self.incremental,
             'primary_key': primary_key
         }
+        if columns:
+            manifest['columns'] = columns
 
         try:
             with open(file, 'w') as file_out:
@@ -483,52 +527,168 @@ class GoogleMyBusiness:
 
     def daily_metrics_parser(self, data_in):
         """
-        Parser dedicated for fetching location metrics
+        Parser dedicated for fetching location metrics, serialises the store straight into a temp csv
         """
+        file_output_destination = os.path.join(self.temp_table_destination, 'daily_metrics')
+        if not os.path.exists(file_output_destination):
+            os.makedirs(file_output_destination)
 
-        data_out = []
-        for location_id, date_data in data_in.items():
-            for date, metrics in date_data.items():
-                for metric, value in metrics.items():
-                    data_out.append({
-                        "location_id": location_id,
-                        "date": date,
-                        "metric": metric,
-                        "value": value
-                    })
-
-        self.create_temp_files('daily_metrics', data_out)
+        filename = os.path.join(file_output_destination, str(uuid.uuid4()) + ".csv")
+        if data_in.write_csv(filename):
+            self.temp_columns.setdefault('daily_metrics', {}).update(dict.fromkeys(DAILY_METRICS_COLUMNS))
+        else:
+            os.remove(filename)
+            logging.warning("File daily_metrics is empty. Results will not be stored.")
 
     def save_resulting_files(self):
         """Produces manifest and saves column names to statefile"""
         filenames = [f.name for f in os.scandir(self.temp_table_destination) if f.is_dir()]
+        if not filenames:
+            return
 
+        tables = {}
         for file_name in filenames:
+            fieldnames = self.tables_columns.get(file_name) or []
+            known_columns = None
+            if file_name in self.temp_columns:
+                known_columns = list(dict.fromkeys(list(fieldnames) + list(self.temp_columns[file_name])))
+            temp_dir = os.path.join(self.temp_table_destination, file_name)
+            tgt_path = os.path.join(self.default_table_destination, file_name + ".csv")
+            tables[file_name] = (temp_dir, tgt_path, fieldnames, self.sliced_output, self.slice_size_bytes,
+                                 known_columns)
 
-            if self.tables_columns.get(file_name, {}):
-                fieldnames = self.tables_columns.get(file_name)
-            else:
-                fieldnames = []
+        workers = min(len(filenames), self.finalise_workers or os.cpu_count() or 1)
+        if workers == 1:
+            results = {file_name: finalise_table(*args) for file_name, args in tables.items()}
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {file_name: executor.submit(finalise_table, *args) for file_name, args in tables.items()}
+                results = {file_name: future.result() for file_name, future in futures.items()}
 
-            temp_dir = os.path.join(self.temp_table_destination, file_name)
-            temp_files = self.list_json_files(temp_dir)
+        for file_name, columns in results.items():
+            if columns is None:
+                continue
+            self.produce_manifest(file_name=file_name, primary_key=mapping[file_name],
+                                  columns=columns if self.sliced_output else None)
+            self.tables_columns[file_name] = columns
 
-            if temp_files:
-                tgt_path = os.path.join(self.default_table_destination, file_name+".csv")
-                with ElasticDictWriter(tgt_path, fieldnames) as wr:
-                    wr.writeheader()
-                    for file in temp_files:
-                        with open(file, 'r') as f:
-                            data = json.load(f)
-                        wr.writerow(data)
 
-                self.produce_manifest(file_name=file_name, primary_key=mapping[file_name])
-                self.tables_columns[file_name] = wr.fieldnames
+def list_temp_files(target_dir):
+    """Lists temp files of a table - json files with a single row each or csv files with a header"""
+    temp_files = []
+    for filename in os.listdir(target_dir):
+        if filename.endswith('.json') or filename.endswith('.csv'):
+            temp_files.append(os.path.join(target_dir, filename))
+    return temp_files
 
-    @staticmethod
-    def list_json_files(target_dir):
-        json_files = []
-        for filename in os.listdir(target_dir):
-            if filename.endswith('.json'):
-                json_files.append(os.path.join(target_dir, filename))
-        return json_files
+
+def iter_temp_rows(temp_files):
+    for file in temp_files:
+        if file.endswith('.csv'):
+            with open(file, 'r', newline='') as f:
+                yield from csv.DictReader(f)
+        else:
+            with open(file, 'r') as f:
+                yield json.load(f)
+
+
+def finalise_table(temp_dir, tgt_path, fieldnames, sliced=False, slice_size_bytes=DEFAULT_SLICE_SIZE_MB * 1024 ** 2,
+                   known_columns=None):
+    """
+    Converts temp rows of a single table into its output csv. Runs in a worker process, returns the final
+    list of columns or None if there was nothing to write. Sliced output needs all the columns upfront, if they
+    are not passed in known_columns, the temp files are scanned for them first.
+    """
+    temp_files = list_temp_files(temp_dir)
+    if not temp_files:
+        return None
+
+    if not sliced:
+        with ElasticDictWriter(tgt_path, fieldnames) as wr:
+            wr.writeheader()
+            for row in iter_temp_rows(temp_files):
+                wr.writerow(row)
+        return wr.fieldnames
+
+    # slices have no header, so all the columns must be known before the first row is written
+    columns = list(known_columns) if known_columns is not None else scan_columns(temp_files, fieldnames)
+    try:
+        write_slices(tgt_path, temp_files, columns, slice_size_bytes)
+    except UnknownColumnsError as e:
+        # temp files not created in this run, e.g. left over in a persisted data folder
+        logging.warning(f"{e}, scanning all temp files of {os.path.basename(temp_dir)} for columns.")
+        columns = scan_columns(temp_files, columns)
+        write_slices(tgt_path, temp_files, columns, slice_size_bytes)
+
+    return columns
+
+
+def scan_columns(temp_files, fieldnames):
+    """Returns fieldnames extended by all the other keys found in the temp files, in order of appearance."""
+    columns = list(fieldnames)
+    seen = set(columns)
+    for row in iter_temp_rows(temp_files):
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+
+def write_slices(tgt_path, temp_files, columns, slice_size_bytes):
+    if os.path.exists(tgt_path):
+        shutil.rmtree(tgt_path)
+    os.makedirs(tgt_path)
+
+    slice_writer = SliceWriter(tgt_path, columns, slice_size_bytes)
+    try:
+        for row in iter_temp_rows(temp_files):
+            slice_writer.writerow(row)
+    finally:
+        slice_writer.close()
+
+
+class UnknownColumnsError(Exception):
+    pass
+
+
+class SliceWriter:
+    """
+    Writes rows as gzip compressed headerless csv slices, starting a new slice once the current one
+    exceeds slice_size_bytes of compressed data. Rows with keys outside of fieldnames raise UnknownColumnsError.
+    """
+
+    def __init__(self, folder_path, fieldnames, slice_size_bytes):
+        self.folder_path = folder_path
+        self.fieldnames = fieldnames
+        self._known_fieldnames = set(fieldnames)
+        self.slice_size_bytes = slice_size_bytes
+        self.slice_count = 0
+        self._raw = None
+        self._out = None
+        self._writer = None
+
+    def _open_slice(self):
+        slice_path = os.path.join(self.folder_path, f"part_{self.slice_count:05d}.csv.gz")
+        self._raw = open(slice_path, 'wb')
+        compressed = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=GZIP_COMPRESS_LEVEL)
+        self._out = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._out, fieldnames=self.fieldnames, restval='', extrasaction='raise',
+                                      lineterminator='\n')
+        self.slice_count += 1
+
+    def writerow(self, row):
+        if not self._known_fieldnames.issuperset(row):
+            unknown = [key for key in row if key not in self._known_fieldnames]
+            raise UnknownColumnsError(f"Row contains columns {unknown} missing from the slice columns")
+        if self._writer is None:
+            self._open_slice()
+        self._writer.writerow(row)
+        if self._raw.tell() >= self.slice_size_bytes:
+            self.close()
+
+    def close(self):
+        if self._out is not None:
+            self._out.close()
+            self._raw.close()
+        self._raw = self._out = self._writer = None
@@ -0,0 +1,178 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+TOP_N = 30
+SAMPLE_INTERVAL = 0.005
+
+PSTATS_FILE = 'profile.pstats'
+COLLAPSED_STACKS_FILE = 'profile_stacks.collapsed'
+SUMMARY_FILE = 'profile_summary.txt'
+
+SLEEP_FUNCTION = ('~', 0, '<built-in method time.sleep>')
+
+
+def _is_http_wait(func):
+    filename, _, name = func
+    return name == 'send' and filename.endswith(os.path.join('requests', 'sessions.py'))
+
+
+def _is_flatten_dict(func):
+    return func[2] == 'flatten_dict'
+
+
+def _is_json_serialisation(func):
+    filename, _, name = func
+    return name in ('dump', 'dumps') and filename.endswith(os.path.join('json', '__init__.py'))
+
+
+def _is_csv_writing(func):
+    """Writer calls only - ElasticDictWriter, SliceWriter (including gzip compression) and the daily metrics store."""
+    filename, _, name = func
+    return (name in ('writerow', 'close') and filename.endswith(os.path.join('csvwriter', 'core.py'))) or \
+           (name in ('writerow', 'close') and filename.endswith('google_my_business.py')) or \
+           (name == 'write_csv' and filename.endswith('daily_metrics.py'))
+
+
+def _is_temp_file_reading(func):
+    """Opening and parsing the json and csv temp files during table finalisation."""
+    filename, _, name = func
+    return name == 'iter_temp_rows' and filename.endswith('google_my_business.py')
+
+
+# categories measured by the cumulative time of the matching functions
+FUNCTION_CATEGORIES = [
+    ('HTTP wait', _is_http_wait),
+    ('flatten_dict', _is_flatten_dict),
+    ('JSON serialisation', _is_json_serialisation),
+    ('temp file reading', _is_temp_file_reading),
+    ('CSV writing', _is_csv_writing),
+]
+
+# categories measured by the time spent in time.sleep called from the matching module
+SLEEP_CATEGORIES = [
+    ('rate limiter sleeps', 'ratelimit'),
+    ('backoff sleeps', 'backoff'),
+]
+
+
+def attribute_time(stats):
+    """
+    Splits the profiled time into categories based on pstats data, returns list of (category, seconds).
+    """
+    attributed = []
+    for category, matches in FUNCTION_CATEGORIES:
+        attributed.append((category, _cumulative_time(stats, matches)))
+
+    sleep_callers = stats.stats.get(SLEEP_FUNCTION, (0, 0, 0, 0, {}))[4]
+    for category, module in SLEEP_CATEGORIES:
+        attributed.append((category, sum(caller_stats[3] for caller, caller_stats in sleep_callers.items()
+                                         if module in caller[0])))
+    return attributed
+
+
+def _cumulative_time(stats, matches):
+    """
+    Cumulative time of the matching functions, counting only calls from outside of the category, so a matching
+    function called by another one (e.g. SliceWriter.close from SliceWriter.writerow) is not counted twice.
+    """
+    total = 0
+    for func, (_, _, _, ct, callers) in stats.stats.items():
+        if not matches(func):
+            continue
+        if not callers:
+            total += ct
+            continue
+        total += sum(caller_stats[3] for caller, caller_stats in callers.items() if not matches(caller))
+    return total
+
+
+class StackSampler(threading.Thread):
+    """
+    Periodically samples the stack of the target thread and counts the collapsed stacks, the output can be fed
+    directly to flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, target_thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as out:
+            for stack, count in self.stacks.most_common():
+                out.write(f"{stack} {count}\n")
+
+
+class ExtractionProfiler:
+    """
+    Context manager running the wrapped code under cProfile and a stack sampler. On exit it writes
+    the pstats file, collapsed stacks and a summary with time attribution and top N hotspots to output_folder.
+    """
+
+    def __init__(self, output_folder, top_n=TOP_N):
+        self.output_folder = output_folder
+        self.top_n = top_n
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident())
+        self.start_time = None
+
+    def __enter__(self):
+        logging.info("Running with debug profiling enabled.")
+        self.start_time = time.perf_counter()
+        self.sampler.start()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profile.disable()
+        self.sampler.stop()
+        total_time = time.perf_counter() - self.start_time
+
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.profile.dump_stats(os.path.join(self.output_folder, PSTATS_FILE))
+        self.sampler.write_collapsed(os.path.join(self.output_folder, COLLAPSED_STACKS_FILE))
+        with open(os.path.join(self.output_folder, SUMMARY_FILE), 'w') as out:
+            out.write(self.summary(total_time))
+
+        logging.info(f"Profiling results written to {self.output_folder}")
+        return False
+
+    def summary(self, total_time):
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+
+        stream.write(f"Total wall time: {total_time:.3f} s\n\nTime attribution:\n")
+        for category, seconds in attribute_time(stats):
+            share = seconds / total_time * 100 if total_time else 0
+            stream.write(f"  {category:<20} {seconds:10.3f} s {share:6.1f} %\n")
+
+        stream.write(f"\nTop {self.top_n} functions by own time:\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top_n)
+        stream.write(f"\nTop {self.top_n} functions by cumulative time:\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_n)
+        return stream.getvalue()
@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict
+
+MODE_PASS_THROUGH = 'pass_through'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+MODES = [MODE_PASS_THROUGH, MODE_RECORD, MODE_REPLAY]
+
+DEFAULT_MAX_SIZE_MB = 1024
+# 400 and 403 are final for some endpoints (unverified location, missing permissions) and must replay as well
+CACHEABLE_STATUS_CODES = [200, 400, 403]
+EXCLUDED_PARAMS = ['access_token']
+ENTRY_SUFFIX = '.json.gz'
+
+
+class ResponseCacheMiss(Exception):
+    pass
+
+
+class CachedResponse:
+    """Minimal stand-in for requests.Response as used by the GoogleMyBusiness client."""
+
+    def __init__(self, status_code, text, error=False):
+        self.status_code = status_code
+        self.text = text
+        self.error = error
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache:
+    """
+    On disk cache of GET responses, keyed by url and normalised params without the access token. Every entry is
+    a gzip compressed json file, least recently used entries are evicted once the cache exceeds max_size_mb.
+    Successful responses and the 400 and 403 errors are cached, the errors are marked as such.
+
+    In record mode the cached responses are served and missing ones are fetched and stored, in replay mode
+    a missing response raises ResponseCacheMiss.
+    """
+
+    def __init__(self, folder_path, mode=MODE_RECORD, max_size_mb=DEFAULT_MAX_SIZE_MB):
+        if mode not in (MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"Unsupported response cache mode {mode}, supported modes are {MODES}.")
+        self.folder_path = folder_path
+        self.mode = mode
+        self.max_size_bytes = int(max_size_mb * 1024 ** 2)
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.folder_path, exist_ok=True)
+        # paths of the entries and their sizes, ordered from the least recently used
+        self._index = OrderedDict((path, size) for _, size, path in sorted(self._entries()))
+        self.size_bytes = sum(self._index.values())
+
+    @property
+    def replay_only(self):
+        return self.mode == MODE_REPLAY
+
+    @staticmethod
+    def key(url, params=None):
+        normalised_params = sorted((str(k), str(v)) for k, v in (params or {}).items() if k not in EXCLUDED_PARAMS)
+        return hashlib.sha256(json.dumps([url, normalised_params]).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder_path, key + ENTRY_SUFFIX)
+
+    def _entries(self):
+        """Returns (mtime, size, path) of all the cache entries."""
+        entries = []
+        for entry in os.scandir(self.folder_path):
+            if entry.name.endswith(ENTRY_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def get(self, url, params=None):
+        path = self._path(self.key(url, params))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Dropping unreadable response cache entry {path}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # refresh mtime so the entry counts as recently used also in the following runs
+        os.utime(path)
+        if path in self._index:
+            self._index.move_to_end(path)
+        self.hits += 1
+        return CachedResponse(entry['status_code'], entry['text'], entry.get('error', False))
+
+    def put(self, url, params, status_code, text):
+        if status_code not in CACHEABLE_STATUS_CODES:
+            return
+
+        path = self._path(self.key(url, params))
+        entry = {'url': url, 'status_code': status_code, 'text': text, 'error': status_code != 200}
+        tmp_path = f"{path}.{uuid.uuid4()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f)
+
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        self.size_bytes += size - self._index.pop(path, 0)
+        self._index[path] = size
+
+        if self.size_bytes > self.max_size_bytes:
+            self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits into max_size_mb."""
+        while self._index and self.size_bytes > self.max_size_bytes:
+            self._remove(next(iter(self._index)))
+
+    def _remove(self, path):
+        self.size_bytes -= self._index.pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -5,10 +5,15 @@ Created on 12. 11. 2018
 '''
 import unittest
 import mock
+import json
 import os
+import shutil
+import tempfile
 from freezegun import freeze_time
 
-from component import Component
+from keboola.component.exceptions import UserException
+
+from component import Component, RESPONSE_CACHE_TAG, RESPONSE_CACHE_ARCHIVE
 
 
 class TestComponent(unittest.TestCase):
@@ -23,6 +28,49 @@ class TestComponent(unittest.TestCase):
             comp.run()
 
 
+
+class TestResponseCacheFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = self.tmp.name
+        for folder in ("in/files", "out/files"):
+            os.makedirs(os.path.join(self.data_dir, folder))
+        with open(os.path.join(self.data_dir, "config.json"), "w") as f:
+            json.dump({"parameters": {}, "storage": {}}, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _component(self):
+        with mock.patch.dict(os.environ, {'KBC_DATADIR': self.data_dir}):
+            return Component()
+
+    def test_replay_without_recorded_cache_fails(self):
+        with self.assertRaises(UserException):
+            self._component().get_response_cache({"mode": "replay"})
+
+    def test_recorded_cache_is_replayed_in_next_run(self):
+        comp = self._component()
+        cache = comp.get_response_cache({"mode": "record"})
+        cache.put("url", {"pageSize": 50}, 200, '{"reviews": []}')
+        comp.save_response_cache(cache)
+
+        with open(os.path.join(self.data_dir, "out", "files", RESPONSE_CACHE_ARCHIVE + ".manifest")) as f:
+            self.assertIn(RESPONSE_CACHE_TAG, json.load(f)["tags"])
+
+        # the next run gets the archive through file input mapping, the working cache folder is gone
+        shutil.rmtree(cache.folder_path)
+        shutil.move(os.path.join(self.data_dir, "out", "files", RESPONSE_CACHE_ARCHIVE),
+                    os.path.join(self.data_dir, "in", "files", "123_" + RESPONSE_CACHE_ARCHIVE))
+        with open(os.path.join(self.data_dir, "in", "files", "123_" + RESPONSE_CACHE_ARCHIVE + ".manifest"), "w") as f:
+            json.dump({"id": 123, "name": RESPONSE_CACHE_ARCHIVE, "tags": [RESPONSE_CACHE_TAG],
+                       "created": "2024-01-01T00:00:00+0100"}, f)
+
+        cache = self._component().get_response_cache({"mode": "replay"})
+        self.assertEqual(cache.get("url", {"pageSize": 50}).json(), {"reviews": []})
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
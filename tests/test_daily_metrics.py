@@ -0,0 +1,59 @@
+import csv
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from daily_metrics import DailyMetricsStore, COLUMNS
+
+
+class TestDailyMetricsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = DailyMetricsStore(date(2023, 12, 30), date(2024, 1, 2), ["CALL_CLICKS", "WEBSITE_CLICKS"])
+
+    def test_day_offset(self):
+        self.assertEqual(self.store.days, 4)
+        self.assertEqual(self.store.day_offset(2023, 12, 30), 0)
+        self.assertEqual(self.store.day_offset(2024, 1, 2), 3)
+
+    def test_iter_rows_skips_missing_values(self):
+        series = self.store.new_series()
+        self.store.set_time_series(series, "WEBSITE_CLICKS", [{"date": {"year": 2023, "month": 12, "day": 30}}])
+        self.store.set_time_series(series, "CALL_CLICKS", [{"date": {"year": 2024, "month": 1, "day": 1},
+                                                            "value": "7"}])
+        self.store.add("123", series)
+
+        self.assertEqual(list(self.store.iter_rows()), [
+            ("123", "2023-12-30", "WEBSITE_CLICKS", 0),
+            ("123", "2024-01-01", "CALL_CLICKS", 7),
+        ])
+
+    def test_set_time_series_skips_dates_outside_of_range(self):
+        series = self.store.new_series()
+        skipped = self.store.set_time_series(series, "CALL_CLICKS",
+                                             [{"date": {"year": 2023, "month": 12, "day": 29}, "value": "1"},
+                                              {"date": {"year": 2024, "month": 1, "day": 2}, "value": "2"},
+                                              {"date": {"year": 2024, "month": 1, "day": 3}, "value": "3"}])
+        self.store.add("123", series)
+
+        self.assertEqual(skipped, ["2023-12-29", "2024-01-03"])
+        self.assertEqual(list(self.store.iter_rows()), [("123", "2024-01-02", "CALL_CLICKS", 2)])
+
+    def test_write_csv(self):
+        series = self.store.new_series()
+        self.store.set_time_series(series, "CALL_CLICKS", [{"date": {"year": 2023, "month": 12, "day": 31},
+                                                            "value": "3"}])
+        self.store.add("123", series)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "daily_metrics.csv")
+            self.assertEqual(self.store.write_csv(path), 1)
+            with open(path, newline="") as f:
+                rows = list(csv.reader(f))
+
+        self.assertEqual(rows, [COLUMNS, ["123", "2023-12-31", "CALL_CLICKS", "3"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
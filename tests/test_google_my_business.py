@@ -0,0 +1,122 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from google_my_business import GoogleMyBusiness, AVAILABLE_DAILY_METRICS
+
+
+class TestSaveResultingFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_folder = self.tmp.name
+        os.makedirs(os.path.join(self.data_folder, "temp"))
+        os.makedirs(os.path.join(self.data_folder, "out", "tables"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _gmb(self, **kwargs):
+        return GoogleMyBusiness(access_token="token", data_folder_path=self.data_folder, incremental=False, **kwargs)
+
+    def _read_manifest(self, table):
+        with open(os.path.join(self.data_folder, "out", "tables", f"{table}.csv.manifest")) as f:
+            return json.load(f)
+
+    def test_single_file_output(self):
+        gmb = self._gmb()
+        gmb.create_temp_files("reviews", [{"reviewId": "1", "comment": "ok"}, {"reviewId": "2", "starRating": 5}])
+        gmb.save_resulting_files()
+
+        with open(os.path.join(self.data_folder, "out", "tables", "reviews.csv")) as f:
+            rows = list(csv.DictReader(f))
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(set(gmb.tables_columns["reviews"]), {"reviewId", "comment", "starRating"})
+        self.assertNotIn("columns", self._read_manifest("reviews"))
+
+    def test_sliced_output_keeps_column_order_across_slices(self):
+        gmb = self._gmb(sliced_output=True, slice_size_mb=1e-6)
+        gmb.tables_columns = {"reviews": ["reviewId"]}
+        gmb.create_temp_files("reviews", [{"comment": "a", "reviewId": "1"},
+                                          {"reviewId": "2", "starRating": 5},
+                                          {"reviewId": "3"}])
+        gmb.save_resulting_files()
+
+        slice_dir = os.path.join(self.data_folder, "out", "tables", "reviews.csv")
+        slices = sorted(os.listdir(slice_dir))
+        self.assertEqual(len(slices), 3)
+        self.assertTrue(all(s.endswith(".csv.gz") for s in slices))
+
+        manifest = self._read_manifest("reviews")
+        columns = manifest["columns"]
+        self.assertEqual(columns[0], "reviewId")
+        self.assertEqual(set(columns), {"reviewId", "comment", "starRating"})
+        self.assertEqual(manifest["primary_key"], ["reviewId"])
+        self.assertEqual(gmb.tables_columns["reviews"], columns)
+
+        rows = []
+        for s in slices:
+            with gzip.open(os.path.join(slice_dir, s), "rt", newline="") as f:
+                rows.extend(csv.DictReader(f, fieldnames=columns))
+        self.assertEqual(sorted(r["reviewId"] for r in rows), ["1", "2", "3"])
+        self.assertEqual([r["starRating"] for r in rows if r["reviewId"] == "2"], ["5"])
+
+    def test_sliced_output_scans_columns_when_unknown(self):
+        gmb = self._gmb(sliced_output=True)
+        gmb.create_temp_files("questions", [{"name": "q1"}, {"name": "q2", "text": "why?"}])
+        gmb.temp_columns = {}
+        gmb.save_resulting_files()
+
+        self.assertEqual(set(self._read_manifest("questions")["columns"]), {"name", "text"})
+        slices = os.listdir(os.path.join(self.data_folder, "out", "tables", "questions.csv"))
+        self.assertEqual(len(slices), 1)
+
+    def test_sliced_output_keeps_columns_of_leftover_temp_files(self):
+        leftover_dir = os.path.join(self.data_folder, "temp", "questions")
+        os.makedirs(leftover_dir)
+        with open(os.path.join(leftover_dir, "leftover.json"), "w") as f:
+            json.dump({"name": "q0", "author": "someone"}, f)
+
+        gmb = self._gmb(sliced_output=True)
+        gmb.create_temp_files("questions", [{"name": "q1"}])
+        gmb.save_resulting_files()
+
+        columns = self._read_manifest("questions")["columns"]
+        self.assertEqual(set(columns), {"name", "author"})
+        slice_dir = os.path.join(self.data_folder, "out", "tables", "questions.csv")
+        rows = []
+        for s in os.listdir(slice_dir):
+            with gzip.open(os.path.join(slice_dir, s), "rt", newline="") as f:
+                rows.extend(csv.DictReader(f, fieldnames=columns))
+        self.assertIn({"name": "q0", "author": "someone"}, rows)
+
+    def test_daily_metrics_output(self):
+        gmb = self._gmb(start_timestamp="2024-01-01T00:00:00.000000Z", end_timestamp="2024-01-02T00:00:00.000000Z")
+        time_series = {"timeSeries": {"datedValues": [{"date": {"year": 2024, "month": 1, "day": 1}, "value": "4"},
+                                                      {"date": {"year": 2024, "month": 1, "day": 2}}]}}
+        response = mock.Mock()
+        response.json.return_value = time_series
+
+        store = gmb.create_daily_metrics_store()
+        with mock.patch.object(GoogleMyBusiness, "get_request", return_value=(200, response)):
+            store.add("1", gmb.list_daily_metrics(location_id="locations/1", store=store))
+        gmb.daily_metrics_parser(store)
+        gmb.save_resulting_files()
+
+        with open(os.path.join(self.data_folder, "out", "tables", "daily_metrics.csv")) as f:
+            rows = list(csv.DictReader(f))
+
+        self.assertEqual(len(rows), 2 * len(AVAILABLE_DAILY_METRICS))
+        self.assertEqual(rows[0], {"location_id": "1", "date": "2024-01-01", "metric": AVAILABLE_DAILY_METRICS[0],
+                                   "value": "4"})
+        self.assertEqual(rows[-1]["value"], "0")
+        self.assertEqual(self._read_manifest("daily_metrics")["primary_key"], ["location_id", "metric", "date"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from google_my_business import GoogleMyBusiness, flatten_dict
+from profiling import ExtractionProfiler, attribute_time, PSTATS_FILE, COLLAPSED_STACKS_FILE, SUMMARY_FILE
+
+
+def workload():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        json.dumps(flatten_dict({"a": {"b": [1, 2, {"c": "d"}]}}))
+
+
+class TestExtractionProfiler(unittest.TestCase):
+
+    def test_writes_profile_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with ExtractionProfiler(tmp) as profiler:
+                workload()
+
+            self.assertTrue(os.path.exists(os.path.join(tmp, PSTATS_FILE)))
+            with open(os.path.join(tmp, COLLAPSED_STACKS_FILE)) as f:
+                stacks = f.read().splitlines()
+            with open(os.path.join(tmp, SUMMARY_FILE)) as f:
+                summary = f.read()
+
+        self.assertTrue(stacks)
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in stacks))
+        self.assertIn("workload", "".join(stacks))
+        self.assertIn("rate limiter sleeps", summary)
+        self.assertIn("Top 30 functions by own time", summary)
+
+        attributed = dict(attribute_time(pstats.Stats(profiler.profile)))
+        self.assertGreater(attributed["flatten_dict"], 0)
+        self.assertGreater(attributed["JSON serialisation"], 0)
+        self.assertEqual(attributed["HTTP wait"], 0)
+
+    def test_separates_temp_file_reading_from_csv_writing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for folder in ("temp", os.path.join("out", "tables"), os.path.join("out", "files")):
+                os.makedirs(os.path.join(tmp, folder))
+            gmb = GoogleMyBusiness(access_token="token", data_folder_path=tmp, sliced_output=True,
+                                   slice_size_mb=1e-4, finalise_workers=1)
+            gmb.create_temp_files("reviews", [{"reviewId": str(i), "comment": "x" * 100} for i in range(300)])
+
+            with ExtractionProfiler(os.path.join(tmp, "out", "files")) as profiler:
+                gmb.save_resulting_files()
+
+        stats = pstats.Stats(profiler.profile)
+        attributed = dict(attribute_time(stats))
+        finalise_time = next(ct for func, (_, _, _, ct, _) in stats.stats.items() if func[2] == "finalise_table")
+
+        self.assertGreater(attributed["temp file reading"], 0)
+        self.assertGreater(attributed["CSV writing"], 0)
+        self.assertLessEqual(attributed["temp file reading"] + attributed["CSV writing"], finalise_time)
+
+    def test_writes_profile_on_failure(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(ValueError):
+                with ExtractionProfiler(tmp):
+                    raise ValueError("failed")
+            self.assertTrue(os.path.exists(os.path.join(tmp, SUMMARY_FILE)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from google_my_business import GoogleMyBusiness
+from response_cache import ResponseCache, ResponseCacheMiss, MODE_REPLAY, ENTRY_SUFFIX
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "response_cache")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_ignores_access_token_and_param_order(self):
+        self.assertEqual(ResponseCache.key("url", {"access_token": "a", "pageSize": 50, "pageToken": "x"}),
+                         ResponseCache.key("url", {"pageToken": "x", "pageSize": "50", "access_token": "b"}))
+        self.assertNotEqual(ResponseCache.key("url", {"pageToken": "x"}), ResponseCache.key("url", {"pageToken": "y"}))
+
+    def test_put_and_get(self):
+        cache = ResponseCache(self.cache_path)
+        cache.put("url", {"pageSize": 50}, 200, '{"reviews": []}')
+        cache.put("url", {"pageSize": 10}, 500, 'error')
+        cache.put("url", {"pageSize": 20}, 403, 'forbidden')
+
+        response = ResponseCache(self.cache_path, mode=MODE_REPLAY).get("url", {"pageSize": 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"reviews": []})
+        self.assertFalse(response.error)
+        self.assertIsNone(cache.get("url", {"pageSize": 10}))
+
+        error = cache.get("url", {"pageSize": 20})
+        self.assertEqual(error.status_code, 403)
+        self.assertTrue(error.error)
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(self.cache_path)
+        cache.put("url/1", None, 200, "a")
+        entry_size = cache.size_bytes
+        cache.max_size_bytes = entry_size * 2
+        os.utime(os.path.join(self.cache_path, cache.key("url/1") + ENTRY_SUFFIX), (0, 0))
+        cache.put("url/2", None, 200, "b")
+        cache.put("url/3", None, 200, "c")
+
+        self.assertIsNone(cache.get("url/1"))
+        self.assertIsNotNone(cache.get("url/2"))
+        self.assertIsNotNone(cache.get("url/3"))
+        self.assertLessEqual(cache.size_bytes, cache.max_size_bytes)
+
+    def test_get_marks_entry_as_recently_used(self):
+        cache = ResponseCache(self.cache_path)
+        cache.put("url/1", None, 200, "a")
+        cache.put("url/2", None, 200, "b")
+        cache.max_size_bytes = cache.size_bytes
+        cache.get("url/1")
+        cache.put("url/3", None, 200, "c")
+
+        self.assertIsNotNone(cache.get("url/1"))
+        self.assertIsNone(cache.get("url/2"))
+
+    def test_index_is_loaded_from_disk_by_last_use(self):
+        cache = ResponseCache(self.cache_path)
+        cache.put("url/1", None, 200, "a")
+        cache.put("url/2", None, 200, "b")
+        os.utime(os.path.join(self.cache_path, cache.key("url/2") + ENTRY_SUFFIX), (0, 0))
+
+        cache = ResponseCache(self.cache_path)
+        cache.max_size_bytes = cache.size_bytes
+        cache.put("url/3", None, 200, "c")
+
+        self.assertIsNone(cache.get("url/2"))
+        self.assertIsNotNone(cache.get("url/1"))
+
+
+class TestGetRequestWithCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "response_cache")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _gmb(self, cache):
+        return GoogleMyBusiness(access_token="token", data_folder_path=self.tmp.name, response_cache=cache,
+                                start_timestamp="2024-01-01T00:00:00.000000Z",
+                                end_timestamp="2024-01-02T00:00:00.000000Z")
+
+    def test_record_then_replay(self):
+        response = mock.Mock(status_code=200, text='{"accounts": [{"name": "accounts/1"}]}')
+        response.json.return_value = {"accounts": [{"name": "accounts/1"}]}
+        gmb = self._gmb(ResponseCache(self.cache_path))
+        with mock.patch.object(GoogleMyBusiness, "send_request", return_value=(200, response)) as send:
+            gmb.list_accounts()
+            gmb.get_request("https://mybusiness.googleapis.com/v1/accounts", params={"access_token": "other"})
+        self.assertEqual(send.call_count, 1)
+
+        gmb = self._gmb(ResponseCache(self.cache_path, mode=MODE_REPLAY))
+        with mock.patch.object(GoogleMyBusiness, "send_request") as send:
+            gmb.list_accounts()
+        send.assert_not_called()
+        self.assertEqual(gmb.account_list, [{"name": "accounts/1"}])
+
+    @mock.patch("time.sleep")
+    def test_error_is_not_cached_and_retry_reaches_api(self, _):
+        error = mock.Mock(status_code=403, text='{"error": "temporary"}')
+        success = mock.Mock(status_code=200, text='{"locations": [{"name": "locations/1"}]}')
+        success.json.return_value = {"locations": [{"name": "locations/1"}]}
+
+        gmb = self._gmb(ResponseCache(self.cache_path))
+        with mock.patch.object(GoogleMyBusiness, "send_request", side_effect=[(403, error), (200, success)]) as send:
+            locations = gmb.list_locations(account_id="accounts/1")
+
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(locations, [{"name": "locations/1", "account_id": "accounts/1"}])
+
+    def test_retried_request_bypasses_cached_error(self):
+        cache = ResponseCache(self.cache_path)
+        locations_url = "https://mybusiness.googleapis.com/v1/accounts/1/locations"
+        gmb = self._gmb(cache)
+        with mock.patch.object(GoogleMyBusiness, "send_request") as send:
+            send.return_value = (403, mock.Mock(status_code=403, text="forbidden"))
+            gmb.get_request(locations_url, params={"readMask": "name"})
+
+            success = mock.Mock(status_code=200, text='{"locations": [{"name": "locations/1"}]}')
+            success.json.return_value = {"locations": [{"name": "locations/1"}]}
+            send.return_value = (200, success)
+            status, _ = gmb.get_request(locations_url, params={"access_token": "token", "readMask": "name"},
+                                        cache_errors=False)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(send.call_count, 2)
+        self.assertFalse(cache.get(locations_url, {"readMask": "name"}).error)
+
+    def test_record_then_replay_with_forbidden_location(self):
+        forbidden = mock.Mock(status_code=403, text='{"error": {"code": 403}}')
+        gmb = self._gmb(ResponseCache(self.cache_path))
+        with mock.patch.object(GoogleMyBusiness, "send_request", return_value=(403, forbidden)) as send:
+            store = gmb.create_daily_metrics_store()
+            self.assertIsNone(gmb.list_daily_metrics(location_id="locations/1", store=store))
+        send.assert_called_once()
+
+        gmb = self._gmb(ResponseCache(self.cache_path, mode=MODE_REPLAY))
+        with mock.patch.object(GoogleMyBusiness, "send_request") as send:
+            store = gmb.create_daily_metrics_store()
+            self.assertIsNone(gmb.list_daily_metrics(location_id="locations/1", store=store))
+        send.assert_not_called()
+
+    def test_replay_miss_fails(self):
+        gmb = self._gmb(ResponseCache(self.cache_path, mode=MODE_REPLAY))
+        with mock.patch.object(GoogleMyBusiness, "send_request") as send:
+            with self.assertRaises(ResponseCacheMiss):
+                gmb.list_accounts()
+        send.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()